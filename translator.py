@@ -7,12 +7,28 @@ translation (LibreTranslate OSS), PDF reconstruction (PyMuPDF).
 import os
 import pathlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pytesseract
 import pymupdf as fitz
 from PIL import Image
-import io
 import json
 import tqdm
+import tempfile
+import shutil
+import functools
+import collections
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+# Each OCR worker runs its own Tesseract; stop them oversubscribing cores.
+# Set before tesserocr loads libgomp, which reads OMP_* only at load time.
+os.environ["OMP_THREAD_LIMIT"] = "1"
+
+try:  # resident engine; falls back to the pytesseract CLI wrapper
+    from tesserocr import PyTessBaseAPI, PSM
+except ImportError:
+    PyTessBaseAPI = None
 
 # ----------------------------------------------------------------------
 # 1.  Download large files only when first needed
@@ -20,111 +36,449 @@ import tqdm
 FASTTEXT_URL = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz"
 FASTTEXT_LOCAL = pathlib.Path(__file__).parent / "lid.176.ftz"
 
+class _RustFastText:
+    """Adapt underthesea_core's FastText to fastText's ``predict(list, k)``.
+
+    The Rust model takes a single string and returns ``[(label, prob)]``
+    with bare labels ("en"); it has no batch call, so texts go one by one.
+    """
+    def __init__(self, model):
+        self._model = model
+
+    def predict(self, texts, k=1):
+        preds = [self._model.predict(text, k=k) for text in texts]
+        labels = [tuple(f"__label__{label}" for label, _ in pred) for pred in preds]
+        probs = [tuple(prob for _, prob in pred) for pred in preds]
+        return labels, probs
+
+@functools.lru_cache(maxsize=1)
 def get_fasttext_model():
-    """Return a fastText language-ID model (lazy download)."""
+    """Return the fastText language-ID model (lazy download, loaded once)."""
     if not FASTTEXT_LOCAL.exists():
         FASTTEXT_LOCAL.write_bytes(requests.get(FASTTEXT_URL, timeout=60).content)
-    import fasttext
-    return fasttext.load_model(str(FASTTEXT_LOCAL))
+    try:  # pure-Rust inference, ~2x faster than the C++ binding
+        from underthesea_core import FastText
+        return _RustFastText(FastText.load(str(FASTTEXT_LOCAL)))
+    except Exception:  # not installed or can't read the model
+        import fasttext
+        return fasttext.load_model(str(FASTTEXT_LOCAL))
+
+TESSDATA = pathlib.Path("/usr/share/tesseract-ocr/4.00/tessdata")
+
+# Tesseract "fast" integer models: ~2-3x quicker than "best", slightly less
+# accurate.  Opt in with TESSDATA_VARIANT=fast.
+TESSDATA_VARIANT = os.environ.get("TESSDATA_VARIANT", "best")
+TESSDATA_FAST_URL = "https://github.com/tesseract-ocr/tessdata_fast/raw/main/script/{}.traineddata"
+TESSDATA_FAST = pathlib.Path(__file__).parent / "tessdata_fast"
+
+def get_tessdata_dir(tess_lang_code):
+    """Return the tessdata dir for TESSDATA_VARIANT (lazy download).
+
+    Falls back to the system TESSDATA when the fast model can't be fetched,
+    e.g. for OSD scripts that tessdata_fast doesn't ship.
+    """
+    if TESSDATA_VARIANT != "fast":
+        return TESSDATA
+    model = TESSDATA_FAST / f"{tess_lang_code}.traineddata"
+    if not model.exists():
+        try:
+            r = requests.get(TESSDATA_FAST_URL.format(tess_lang_code), timeout=60)
+            r.raise_for_status()
+        except requests.RequestException:
+            return TESSDATA
+        TESSDATA_FAST.mkdir(exist_ok=True)
+        # write then rename, so an interrupted download never leaves a
+        # truncated model behind to be reused
+        fd, part = tempfile.mkstemp(dir=TESSDATA_FAST, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(r.content)
+        os.replace(part, model)
+    return TESSDATA_FAST
 
 # ----------------------------------------------------------------------
 # 2.  Helpers
 # ----------------------------------------------------------------------
 LIBRE_URL = "https://libretranslate.com/translate"   # free, no key
+PAGE_BREAK = "\n%%%PGBRK%%%\n"     # sentinel joining pages in one request
+BATCH_CHARS = 5000                 # stay under LibreTranslate's size cap
+TRANSLATE_WORKERS = 8              # concurrent LibreTranslate requests
+
+OCR_BATCH = 4                      # pages per Tesseract CLI run
+RENDER_AHEAD = 4                   # rendered pages waiting for OCR
+
+RETRY_AFTER_MAX = 10               # longest Retry-After sleep honoured (s)
+
+class _CappedRetry(Retry):
+    """Retry that never sleeps longer than RETRY_AFTER_MAX on Retry-After."""
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, RETRY_AFTER_MAX)
+
+_SESSION = requests.Session()      # keep-alive across calls
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8, pool_maxsize=16,
+    # retry refused connections and 429/5xx only; a read timeout already
+    # cost 30 s and the caller falls back per page anyway
+    max_retries=_CappedRetry(total=3, read=0, backoff_factor=0.5,
+                             status_forcelist=(429, 500, 502, 503, 504),
+                             allowed_methods=frozenset({"GET", "POST"})),
+))
+
+_TESS_LANG_MAP = {
+    "Hindi": "Devanagari",
+    "Bengali": "Bengali",
+    "Tamil": "Tamil",
+    "Telugu": "Telugu",
+    "Marathi": "Devanagari",
+    "Gujarati": "Gujarati",
+    "Kannada": "Kannada",
+    "Malayalam": "Malayalam",
+    "Odia": "Oriya",
+    "Punjabi": "Gurmukhi",
+    "Assamese": "Bengali",
+    "Urdu": "Arabic",
+    "Sanskrit": "Devanagari",
+    "Nepali": "Devanagari",
+    "Konkani": "Devanagari",
+    "Bodo": "Devanagari",
+    "Dogri": "Devanagari",
+    "Maithili": "Devanagari",
+    "Manipuri": "Bengali",
+    "Santhali": "Bengali",
+    "Sindhi": "Arabic",
+    "Kashmiri": "Arabic",
+}
 
 def tess_lang(lang_code: str) -> str:
     """Map human name to Tesseract script identifier."""
-    mapping = {
-        "Hindi": "Devanagari",
-        "Bengali": "Bengali",
-        "Tamil": "Tamil",
-        "Telugu": "Telugu",
-        "Marathi": "Devanagari",
-        "Gujarati": "Gujarati",
-        "Kannada": "Kannada",
-        "Malayalam": "Malayalam",
-        "Odia": "Oriya",
-        "Punjabi": "Gurmukhi",
-        "Assamese": "Bengali",
-        "Urdu": "Arabic",
-        "Sanskrit": "Devanagari",
-        "Nepali": "Devanagari",
-        "Konkani": "Devanagari",
-        "Bodo": "Devanagari",
-        "Dogri": "Devanagari",
-        "Maithili": "Devanagari",
-        "Manipuri": "Bengali",
-        "Santhali": "Bengali",
-        "Sindhi": "Arabic",
-        "Kashmiri": "Arabic",
-    }
-    return mapping.get(lang_code, "Devanagari")
+    return _TESS_LANG_MAP.get(lang_code, "Devanagari")
+
+# tiny map fastText code → human name
+_CODE2LANG = {"en": "English", "hi": "Hindi", "bn": "Bengali",
+              "ta": "Tamil", "te": "Telugu", "mr": "Marathi",
+              "gu": "Gujarati", "kn": "Kannada", "ml": "Malayalam",
+              "or": "Odia", "pa": "Punjabi", "as": "Assamese",
+              "ur": "Urdu", "sa": "Sanskrit", "ne": "Nepali",
+              "kok": "Konkani", "brx": "Bodo", "doi": "Dogri",
+              "mai": "Maithili", "mni": "Manipuri", "sat": "Santhali",
+              "sd": "Sindhi", "ks": "Kashmiri"}
 
 def detect_language(texts):
-    """Return the dominant language code (e.g. 'en', 'hi')."""
-    model = get_fasttext_model()
-    joined = " ".join(texts).replace("\n", " ")
-    pred = model.predict(joined, k=1)
-    lang = pred[0][0].replace("__label__", "")
-    # tiny map fastText code → human name
-    code2lang = {"en": "English", "hi": "Hindi", "bn": "Bengali",
-                 "ta": "Tamil", "te": "Telugu", "mr": "Marathi",
-                 "gu": "Gujarati", "kn": "Kannada", "ml": "Malayalam",
-                 "or": "Odia", "pa": "Punjabi", "as": "Assamese",
-                 "ur": "Urdu", "sa": "Sanskrit", "ne": "Nepali",
-                 "kok": "Konkani", "brx": "Bodo", "doi": "Dogri",
-                 "mai": "Maithili", "mni": "Manipuri", "sat": "Santhali",
-                 "sd": "Sindhi", "ks": "Kashmiri"}
-    return code2lang.get(lang, lang)
+    """Return the dominant language (e.g. 'English', 'Hindi').
+
+    Accepts one string or a list of page texts; pages are predicted in a
+    single batched call and vote weighted by their length.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    texts = [t.replace("\n", " ") for t in texts if t and t.strip()] or [""]
+    labels, _ = get_fasttext_model().predict(texts, k=1)
+    votes = collections.Counter()
+    for text, label in zip(texts, labels):
+        votes[label[0]] += len(text)
+    lang = votes.most_common(1)[0][0].replace("__label__", "")
+    return _CODE2LANG.get(lang, lang)
+
+def render_page(page):
+    """Rasterise a page at 2× straight into a grayscale PIL image for OCR."""
+    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), colorspace=fitz.csGRAY,
+                          alpha=False)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+def script_hint(doc, page_texts, renders):
+    """Pick one Tesseract script for every scanned page of the document.
+
+    A page rendered for the OSD probe is left in ``renders`` for OCR reuse.
+    """
+    native = [t for t in page_texts if t.strip()]
+    if native:
+        return tess_lang(detect_language(native))
+    # fully scanned: ask Tesseract's orientation & script detection once
+    try:
+        renders[0] = render_page(doc[0])
+        osd = pytesseract.image_to_osd(
+            renders[0],
+            output_type=pytesseract.Output.DICT,
+            config=f"--tessdata-dir {TESSDATA}"
+        )
+        return osd["script"]
+    except Exception:
+        return tess_lang(None)  # default script
+
+def strip_text_layer(doc, page_texts):
+    """Redact the text from ``doc``'s native pages in place.
+
+    Images and drawings stay, so translated text can replace the original
+    rather than sit on top of it.  ``doc`` is never saved.
+    """
+    for page, native in zip(doc, page_texts):
+        if native.strip():
+            page.add_redact_annot(page.rect, fill=False)
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE)
+
+def _ocr_batch(images, tess_lang_code, tessdata_dir):
+    """OCR a batch of pages in one Tesseract CLI run (file-list mode)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, img in enumerate(images):
+            path = pathlib.Path(tmp) / f"page_{i}.pnm"  # uncompressed
+            img.save(path)
+            paths.append(str(path))
+        list_path = pathlib.Path(tmp) / "list.txt"
+        list_path.write_text("\n".join(paths) + "\n")
+        text = pytesseract.image_to_string(
+            str(list_path),
+            lang=tess_lang_code,
+            config=f"--tessdata-dir {tessdata_dir}"
+        )
+    # Tesseract ends every page with a form feed
+    pages = text.split("\f")
+    pages += [""] * (len(images) - len(pages))
+    return pages[:len(images)]
+
+def _ocr_worker(jobs, texts, tess_lang_code, tessdata_dir):
+    """Consume (page index, image) jobs until a None sentinel arrives.
+
+    Each worker keeps its own tesserocr engine resident, or without
+    tesserocr runs the Tesseract CLI on small file-list batches; either
+    way recognition happens outside the GIL.
+    """
+    seen_sentinel = False
+    try:
+        if PyTessBaseAPI is not None:
+            api = None  # loaded on the first page, so native PDFs pay nothing
+            try:
+                for idx, img in iter(jobs.get, None):
+                    if api is None:
+                        api = PyTessBaseAPI(path=tessdata_dir,
+                                            lang=tess_lang_code, psm=PSM.AUTO)
+                    api.SetImage(img)
+                    texts[idx] = api.GetUTF8Text()
+                seen_sentinel = True
+            finally:
+                if api is not None:
+                    api.End()
+            return
+        pending = []
+        while not seen_sentinel:
+            ran_dry = False
+            try:  # block only while idle, so buffered pages never wait
+                job = jobs.get(block=not pending)
+                seen_sentinel = job is None
+                if not seen_sentinel:
+                    pending.append(job)
+            except queue.Empty:
+                ran_dry = True
+            if pending and (ran_dry or seen_sentinel
+                            or len(pending) == OCR_BATCH):
+                images = [img for _, img in pending]
+                for (idx, _), text in zip(
+                        pending, _ocr_batch(images, tess_lang_code, tessdata_dir)):
+                    texts[idx] = text
+                pending = []
+    except BaseException:
+        if not seen_sentinel:  # keep draining so the producer never blocks
+            for _ in iter(jobs.get, None):
+                pass
+        raise
+
+def _libre_post(text, source, target):
+    payload = {"q": text, "source": source, "target": target, "format": "text"}
+    r = _SESSION.post(LIBRE_URL, data=payload, timeout=30)
+    r.raise_for_status()
+    return r.json()["translatedText"]
 
 def translate(text, source, target):
     """Translate via LibreTranslate public endpoint (free)."""
     if source == target or not text.strip():
         return text
-    payload = {"q": text, "source": source, "target": target, "format": "text"}
     try:
-        r = requests.post(LIBRE_URL, data=payload, timeout=30)
-        r.raise_for_status()
-        return r.json()["translatedText"]
+        return _libre_post(text, source, target)
     except Exception:
         return text  # graceful fallback
 
+def _split_long(text, limit=BATCH_CHARS):
+    """Cut an over-long page into ``(piece, joiner)`` pairs under ``limit``.
+
+    ``joiner`` is what the cut removed: a line break, the spaces where an
+    over-long line was split, or "" for a hard cut in a line without one,
+    so ``"".join(p + j for p, j in pairs) == text``.
+    """
+    if len(text) <= limit:
+        return [(text, "")]
+    pairs, cur = [], None
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if cur is not None:
+                pairs.append((cur, "\n"))
+                cur = None
+            cut = line.rfind(" ", 0, limit)
+            if cut <= 0:
+                cut = limit
+            rest = line[cut:].lstrip(" ")
+            pairs.append((line[:cut], line[cut:len(line) - len(rest)]))
+            line = rest
+        if cur is None:
+            cur = line
+        elif len(cur) + 1 + len(line) > limit:
+            pairs.append((cur, "\n"))
+            cur = line
+        else:
+            cur += "\n" + line
+    pairs.append((cur, ""))
+    return pairs
+
+def _unjoin(translated, count):
+    """Split a batched translation back into ``count`` parts, or None.
+
+    Only the line breaks PAGE_BREAK itself added are removed, so each part
+    keeps its own leading and trailing newlines.
+    """
+    parts = translated.split(PAGE_BREAK.strip())
+    if len(parts) != count:  # separator lost in translation
+        return None
+    for k, part in enumerate(parts):
+        if k > 0 and part.startswith("\n"):
+            part = part[1:]
+        if k < count - 1 and part.endswith("\n"):
+            part = part[:-1]
+        parts[k] = part
+    return parts
+
+def translate_batch(texts, source, target):
+    """Translate many pages in as few requests as possible, order preserved."""
+    out = list(texts)
+    if source == target:
+        return out
+
+    # split over-long pages so every request stays under the size cap
+    pieces, joiners, owners = [], [], []
+    for i, text in enumerate(texts):
+        if text.strip():
+            for piece, joiner in _split_long(text):
+                pieces.append(piece)
+                joiners.append(joiner)
+                owners.append(i)
+
+    # pack non-empty pieces into groups of at most BATCH_CHARS
+    groups, cur, size = [], [], 0
+    for j, piece in enumerate(pieces):
+        if not piece.strip():
+            continue
+        if cur and size + len(piece) > BATCH_CHARS:
+            groups.append(cur)
+            cur, size = [], 0
+        cur.append(j)
+        size += len(piece) + len(PAGE_BREAK)
+    if cur:
+        groups.append(cur)
+
+    def post_group(group):
+        try:
+            joined = PAGE_BREAK.join(pieces[j] for j in group)
+            return _unjoin(_libre_post(joined, source, target), len(group))
+        except Exception:
+            return None
+
+    # at most TRANSLATE_WORKERS requests in flight, sharing _SESSION's pool
+    done = list(pieces)
+    with ThreadPoolExecutor(TRANSLATE_WORKERS) as ex:
+        failed = []
+        for group, parts in zip(groups, ex.map(post_group, groups)):
+            if parts is None:
+                failed.extend(group)
+                continue
+            for j, text in zip(group, parts):
+                done[j] = text
+        # batch unusable: translate those pieces one by one instead
+        retried = ex.map(lambda j: translate(pieces[j], source, target), failed)
+        for j, text in zip(failed, retried):
+            done[j] = text
+
+    # stitch pieces back into their pages, restoring what each cut removed
+    stitched = {}
+    for i, text, joiner in zip(owners, done, joiners):
+        stitched.setdefault(i, []).append(text + joiner)
+    for i, parts in stitched.items():
+        out[i] = "".join(parts)
+    return out
+
 # ----------------------------------------------------------------------
 # 3.  Main routine
 # ----------------------------------------------------------------------
 def process_pdf(src_path, dst_path, target_lang=None):
-    doc = fitz.open(src_path)
-    all_texts = []
-
-    # 1. Extract / OCR text per page
-    for page in tqdm.tqdm(doc, desc="OCR"):
-        if page.get_text().strip():
-            all_texts.append(page.get_text())
-        else:  # scanned image
-            mat = fitz.Matrix(2, 2)
-            pix = page.get_pixmap(matrix=mat)
-            img = Image.open(io.BytesIO(pix.tobytes()))
-            lang = detect_language([page.get_text()])
-            tess_lang_code = tess_lang(lang)
-            text = pytesseract.image_to_string(
-                img,
-                lang=tess_lang_code,
-                config="--tessdata-dir /usr/share/tesseract-ocr/4.00/tessdata"
-            )
-            all_texts.append(text)
+    with fitz.open(src_path) as doc:
+        _translate_doc(doc, src_path, dst_path, target_lang)
 
-    detected_lang = detect_language(all_texts)
-    if target_lang is None:
-        target_lang = "English"
-    translated_pages = [translate(t, detected_lang, target_lang) for t in all_texts]
+def _copy_if_untranslated(src_path, dst_path, detected_lang, target_lang):
+    """Copy the source through if it is already in the default target."""
+    if target_lang is None and detected_lang == "English":
+        shutil.copyfile(src_path, dst_path)
+        return True
+    return False
 
-    # 2. Re-assemble PDF
+def _translate_doc(doc, src_path, dst_path, target_lang):
+    # 1. Native text first: it picks the OCR script for the whole document
+    page_texts = [page.get_text() for page in doc]  # parse each page once
+    all_texts = [None] * len(doc)
+    renders = {}  # page index -> image already rendered
+    detected_lang = None
+    if all(t.strip() for t in page_texts):
+        # nothing to OCR: settle the language before any page work
+        detected_lang = detect_language(page_texts)
+        if _copy_if_untranslated(src_path, dst_path, detected_lang, target_lang):
+            return
+        tess_lang_code = tessdata_dir = None  # no scanned pages to OCR
+    else:
+        tess_lang_code = script_hint(doc, page_texts, renders)
+        tessdata_dir = str(get_tessdata_dir(tess_lang_code))
+    strip_text_layer(doc, page_texts)
     out = fitz.open()
-    for idx, (page, new_text) in enumerate(zip(doc, translated_pages)):
-        rect = page.rect
-        new_page = out.new_page(width=rect.width, height=rect.height)
 
-        if page.get_text().strip():  # native PDF → replace text
+    # 2. One pass over the pages: lay out each output page and render
+    #    scanned ones while the workers OCR what is already queued
+    workers = os.cpu_count() or 1
+    jobs = queue.Queue(maxsize=RENDER_AHEAD)
+    with ThreadPoolExecutor(workers) as ex:
+        consumers = [
+            ex.submit(_ocr_worker, jobs, all_texts, tess_lang_code, tessdata_dir)
+            for _ in range(workers)
+        ]
+        try:
+            for page in tqdm.tqdm(doc, desc="OCR"):
+                rect = page.rect
+                new_page = out.new_page(width=rect.width, height=rect.height)
+                # reuse the original page content, embedded image streams
+                # included; blank pages have nothing to show
+                if page.get_contents():
+                    new_page.show_pdf_page(rect, doc, page.number)
+
+                if page_texts[page.number].strip():
+                    all_texts[page.number] = page_texts[page.number]
+                else:  # scanned image
+                    img = renders.pop(page.number, None)
+                    if img is None:
+                        img = render_page(page)
+                    jobs.put((page.number, img))
+        finally:
+            for _ in consumers:
+                jobs.put(None)
+        for f in consumers:
+            f.result()
+
+    # 3. Translate, then write the text onto the pages laid out above
+    if detected_lang is None:  # scanned pages: OCR text counts too
+        detected_lang = detect_language(all_texts)
+        if _copy_if_untranslated(src_path, dst_path, detected_lang, target_lang):
+            return
+    if target_lang is None:
+        target_lang = "English"
+    translated_pages = translate_batch(all_texts, detected_lang, target_lang)
+
+    for new_page, native, new_text in zip(out, page_texts, translated_pages):
+        if native.strip():  # native PDF → replace text
             new_page.insert_text(
                 fitz.Point(72, 72), new_text, fontname="helv", fontsize=11
             )
@@ -132,10 +486,5 @@ def process_pdf(src_path, dst_path, target_lang=None):
             new_page.insert_text(
                 fitz.Point(72, 72), new_text, fontname="helv", fontsize=11, color=(1, 0, 0)
             )
-        # copy original images
-        for img in page.get_images(full=True):
-            xref = img[0]
-            pix = fitz.Pixmap(doc, xref)
-            new_page.insert_image(rect, pixmap=pix)
 
     out.save(dst_path)